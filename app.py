@@ -2,6 +2,30 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 from io import BytesIO
+import pyarrow as pa
+from pyarrow import csv as pa_csv
+from numba import njit
+
+# Leitura em cache: o Streamlit reexecuta o script a cada interação.
+# Os caches são limitados para não reter todos os arquivos enviados na memória do servidor
+@st.cache_data(max_entries=5, ttl=3600)
+def carregar_arquivo(conteudo, nome):
+    if nome.endswith('.csv'):
+        # O pyarrow infere datas a partir de texto; identificador e grupo ficam como texto.
+        # Os tipos vão direto ao pyarrow: o dtype= do pandas converteria as demais colunas
+        # inteiras de volta para numpy e falharia em células vazias. Colunas ausentes
+        # no arquivo são ignoradas e células vazias de texto continuam ausentes
+        opcoes = pa_csv.ConvertOptions(
+            column_types={'identificador': pa.string(), 'grupo': pa.string()},
+            strings_can_be_null=True
+        )
+        return pa_csv.read_csv(BytesIO(conteudo), convert_options=opcoes).to_pandas()
+    return pd.read_excel(BytesIO(conteudo))
+
+# Alocação em cache; _df fica fora do hash e o conteúdo é identificado por chave_df
+@st.cache_data(show_spinner=False, max_entries=20, ttl=3600)
+def calcular_alocacao_em_cache(chave_df, _df, mesmo_grupo, min_alocacao):
+    return calcular_alocacao(_df, mesmo_grupo, min_alocacao)
 
 def main():
     st.title("📊 Sistema de Alocação de Demanda e Capacidade")
@@ -17,10 +41,7 @@ def main():
     uploaded_file = st.file_uploader("Carregar arquivo (CSV ou Excel)", type=["csv", "xlsx", "xls"])
     
     if uploaded_file is not None:
-        if uploaded_file.name.endswith('.csv'):
-            df = pd.read_csv(uploaded_file)
-        else:
-            df = pd.read_excel(uploaded_file)
+        df = carregar_arquivo(uploaded_file.getvalue(), uploaded_file.name)
         st.success(f"Dados carregados com sucesso! ({uploaded_file.name})")
     else:
         st.info("Use o formato padrão: identificador, grupo, capacidade_instalada, demanda")
@@ -42,6 +63,16 @@ def main():
         st.error(f"Colunas necessárias não encontradas. Requeridas: {', '.join(required_columns)}")
         st.stop()
     
+    # Colunas inteiras em int32 quando os valores cabem. Um tipo fixo evita que o
+    # kernel Numba seja recompilado para cada largura de inteiro (int8, int16, ...)
+    limites_int32 = np.iinfo(np.int32)
+    for coluna in ('capacidade_instalada', 'demanda'):
+        valores = pd.to_numeric(df[coluna])
+        if (pd.api.types.is_integer_dtype(valores)
+                and valores.between(limites_int32.min, limites_int32.max).all()):
+            valores = valores.astype(np.int32)
+        df[coluna] = valores
+    
     # Parâmetros de configuração
     st.sidebar.header("⚙️ Configurações")
     mesmo_grupo = st.sidebar.checkbox("Alocar apenas dentro do mesmo grupo", value=True)
@@ -50,14 +81,15 @@ def main():
     
     if st.button("▶️ Executar Alocação"):
         with st.spinner('Otimizando alocações...'):
-            resultado = calcular_alocacao(df, mesmo_grupo, min_alocacao)
+            chave_df = (tuple(df.columns), pd.util.hash_pandas_object(df).values.tobytes())
+            resultado = calcular_alocacao_em_cache(chave_df, df, mesmo_grupo, min_alocacao)
         
         st.subheader("📊 Resultado Final da Alocação")
         st.dataframe(resultado['df_final'])
         
-        # Botão de exportação
+        # Botões de exportação
         output = BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
             resultado['df_final'].to_excel(writer, sheet_name='Resultado', index=False)
         output.seek(0)
         
@@ -67,104 +99,86 @@ def main():
             file_name="resultado_alocacao.xlsx",
             mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
         )
+        st.download_button(
+            label="📤 Exportar para CSV",
+            data=resultado['df_final'].to_csv(index=False).encode('utf-8'),
+            file_name="resultado_alocacao.csv",
+            mime="text/csv"
+        )
         
         st.subheader("📈 Resumo da Otimização")
         resumo = resultado['resumo']
         
-        col1, col2, col3 = st.columns(3)
-        col1.metric("Demanda não atendida inicial", resumo['demanda_na_inicial'])
-        col2.metric("Demanda não atendida final", resumo['demanda_na_final'])
-        col3.metric("Eficiência", f"{resumo['eficiencia']:.1f}%")
-        
-        col1, col2, col3 = st.columns(3)
-        col1.metric("Capacidade ociosa inicial", resumo['capacidade_ociosa_inicial'])
-        col2.metric("Capacidade ociosa final", resumo['capacidade_ociosa_final'])
-        col3.metric("Demanda alocada externamente", resumo['demanda_alocada'])
+        # Tabela única de métricas (valores como texto para manter a coluna homogênea)
+        resumo_df = pd.DataFrame([
+            ["Demanda não atendida inicial", f"{resumo['demanda_na_inicial']}"],
+            ["Demanda não atendida final", f"{resumo['demanda_na_final']}"],
+            ["Eficiência", f"{resumo['eficiencia']:.1f}%"],
+            ["Capacidade ociosa inicial", f"{resumo['capacidade_ociosa_inicial']}"],
+            ["Capacidade ociosa final", f"{resumo['capacidade_ociosa_final']}"],
+            ["Demanda alocada externamente", f"{resumo['demanda_alocada']}"]
+        ], columns=['Métrica', 'Valor']).set_index('Métrica')
+        st.table(resumo_df)
 
 def calcular_alocacao(df, mesmo_grupo, min_alocacao):
-    # Cópia do DataFrame para cálculos
-    df = df.copy()
+    # Grupos como códigos inteiros compactos (-1 = sem grupo)
+    grupo_id, grupos = pd.factorize(df['grupo'])
+    grupo_id = grupo_id.astype(np.int16 if len(grupos) <= np.iinfo(np.int16).max else np.int32)
     
     # Fase 1: Auto-atendimento
-    df['demanda_atendida_local'] = np.minimum(df['demanda'], df['capacidade_instalada'])
-    df['demanda_na'] = df['demanda'] - df['demanda_atendida_local']
-    df['capacidade_ociosa'] = df['capacidade_instalada'] - df['demanda_atendida_local']
-    
-    # Inicializar coluna de detalhes de alocação
-    df['demanda_atendida_por'] = ""
+    demanda = df['demanda'].to_numpy(copy=False)
+    capacidade = df['capacidade_instalada'].to_numpy(copy=False)
+    atendida_local = np.minimum(demanda, capacidade)
     
-    # Preparar estruturas para alocação
-    unidades = df.to_dict('records')
+    # Arrays paralelos para a fase 2 (o kernel atualiza estes arrays no próprio lugar;
+    # o DataFrame de entrada não é alterado)
+    identificador = df['identificador'].to_numpy()
+    demanda_na = demanda - atendida_local
+    capacidade_ociosa = capacidade - atendida_local
+    demanda_na_inicial = np.nansum(demanda_na)
+    capacidade_ociosa_inicial = np.nansum(capacidade_ociosa)
     
-    # Identificar origens (demanda não atendida) e destinos (capacidade ociosa)
-    origens = [u for u in unidades if u['demanda_na'] > 0]
-    destinos = [u for u in unidades if u['capacidade_ociosa'] >= min_alocacao]
-    
-    # Ordenar para priorizar maior demanda não atendida e maior capacidade ociosa
-    origens.sort(key=lambda x: x['demanda_na'], reverse=True)
-    destinos.sort(key=lambda x: x['capacidade_ociosa'], reverse=True)
+    # Fase 2: Alocar demanda não atendida (dispensada quando nenhuma origem ou
+    # nenhum destino atinge o mínimo, o que também evita compilar o kernel)
+    if (len(df) == 0 or demanda_na.max() < min_alocacao
+            or capacidade_ociosa.max() < min_alocacao):
+        origem_idx = destino_idx = np.empty(0, dtype=np.int64)
+        quantidade = np.empty(0, dtype=demanda_na.dtype)
+    else:
+        origem_idx, destino_idx, quantidade = _alocacao_gulosa(
+            demanda_na, capacidade_ociosa, grupo_id, mesmo_grupo, min_alocacao
+        )
     
-    # Dicionário para rastrear alocações
-    alocacoes_detalhadas = {unidade['identificador']: [] for unidade in unidades}
+    # Formatar detalhes de alocação: o kernel emite as alocações de cada origem
+    # em sequência, então cada origem ocupa um trecho contíguo dos arrays
+    detalhes = np.full(len(df), "Auto-atendimento", dtype=object)
+    if len(origem_idx):
+        rotulos = [
+            f"{destino} ({qtd})"
+            for destino, qtd in zip(identificador[destino_idx].tolist(), quantidade.tolist())
+        ]
+        limites = np.flatnonzero(np.diff(origem_idx)) + 1
+        inicios = [0] + limites.tolist()
+        fins = limites.tolist() + [len(origem_idx)]
+        for inicio, fim in zip(inicios, fins):
+            detalhes[origem_idx[inicio]] = "; ".join(rotulos[inicio:fim])
     
-    # Fase 2: Alocar demanda não atendida
-    for origem in origens:
-        if origem['demanda_na'] < min_alocacao:
-            continue
-            
-        for destino in destinos:
-            # Verificar se é a mesma unidade ou capacidade insuficiente
-            if origem['identificador'] == destino['identificador'] or destino['capacidade_ociosa'] < min_alocacao:
-                continue
-                
-            # Verificar restrição de grupo
-            if mesmo_grupo and origem['grupo'] != destino['grupo']:
-                continue
-                
-            # Calcular quantidade possível de alocar
-            qtd_alocada = min(origem['demanda_na'], destino['capacidade_ociosa'])
-            
-            # Aplicar mínimo de alocação
-            if qtd_alocada < min_alocacao:
-                continue
-                
-            # Atualizar unidades
-            origem['demanda_na'] -= qtd_alocada
-            destino['capacidade_ociosa'] -= qtd_alocada
-            
-            # Registrar alocação detalhada
-            alocacoes_detalhadas[origem['identificador']].append({
-                'destino': destino['identificador'],
-                'quantidade': qtd_alocada
-            })
-            
-            # Parar se demanda totalmente alocada
-            if origem['demanda_na'] < min_alocacao:
-                break
-    
-    # Formatar detalhes de alocação
-    for unidade in unidades:
-        alocacoes = alocacoes_detalhadas[unidade['identificador']]
-        if alocacoes:
-            detalhes = []
-            for aloc in alocacoes:
-                detalhes.append(f"{aloc['destino']} ({aloc['quantidade']})")
-            unidade['demanda_atendida_por'] = "; ".join(detalhes)
-        else:
-            unidade['demanda_atendida_por'] = "Auto-atendimento"
-    
-    # Atualizar DataFrame final
-    df_final = pd.DataFrame(unidades)
-    df_final['demanda_na_final'] = df_final['demanda_na']
-    df_final['capacidade_ociosa_final'] = df_final['capacidade_ociosa']
-    df_final['demanda_atendida_total'] = df_final['demanda'] - df_final['demanda_na_final']
+    # Montar DataFrame final diretamente a partir dos arrays
+    df_final = pd.DataFrame({
+        'identificador': identificador,
+        'grupo': df['grupo'].to_numpy(),
+        'capacidade_instalada': capacidade,
+        'demanda': demanda,
+        'demanda_atendida_local': atendida_local,
+        'demanda_na_final': demanda_na,
+        'capacidade_ociosa_final': capacidade_ociosa,
+        'demanda_atendida_por': detalhes
+    })
     
     # Calcular métricas resumidas
-    demanda_na_inicial = df['demanda_na'].sum()
-    demanda_na_final = df_final['demanda_na_final'].sum()
-    capacidade_ociosa_inicial = df['capacidade_ociosa'].sum()
-    capacidade_ociosa_final = df_final['capacidade_ociosa_final'].sum()
-    demanda_alocada = sum(len(aloc) > 0 for aloc in alocacoes_detalhadas.values())
+    # np.nansum ignora células vazias, como Series.sum
+    demanda_na_final = np.nansum(demanda_na)
+    capacidade_ociosa_final = np.nansum(capacidade_ociosa)
     
     # Nova eficiência: demanda alocada / demanda não atendida inicial
     if demanda_na_inicial > 0:
@@ -182,12 +196,140 @@ def calcular_alocacao(df, mesmo_grupo, min_alocacao):
     }
     
     return {
-        'df_final': df_final[['identificador', 'grupo', 'capacidade_instalada', 'demanda', 
-                              'demanda_atendida_local', 'demanda_na_final', 
-                              'capacidade_ociosa_final', 'demanda_atendida_por']],
+        'df_final': df_final,
         'resumo': resumo
     }
 
+# Fase 2 compilada: guloso de maior demanda não atendida para maior capacidade
+# ociosa sobre arrays paralelos. Atualiza demanda_na e capacidade_ociosa no
+# próprio array e retorna (origem, destino, quantidade) de cada alocação.
+@njit(cache=True)
+def _alocacao_gulosa(demanda_na, capacidade_ociosa, grupo_id, mesmo_grupo, min_alocacao):
+    n = demanda_na.shape[0]
+    # Mínimo efetivo de 1 unidade: cada alocação esgota a origem ou o destino,
+    # logo há no máximo n alocações
+    limite = max(min_alocacao, 1)
+    
+    if not mesmo_grupo:
+        return _varredura_sem_grupo(demanda_na, capacidade_ociosa, limite)
+    
+    grupo = grupo_id
+    n_grupos = 0
+    for i in range(n):
+        if grupo[i] >= n_grupos:
+            n_grupos = grupo[i] + 1
+    
+    # Ordenação estável: maior demanda não atendida e maior capacidade ociosa primeiro
+    origens = np.argsort(-demanda_na, kind='mergesort')
+    destinos = np.argsort(-capacidade_ociosa, kind='mergesort')
+    
+    # Baldes de destinos por grupo (grupo -1 = sem grupo, não recebe alocação)
+    inicio = np.zeros(n_grupos + 1, dtype=np.int64)
+    for d in destinos:
+        if grupo[d] >= 0 and capacidade_ociosa[d] >= limite:
+            inicio[grupo[d] + 1] += 1
+    for g in range(n_grupos):
+        inicio[g + 1] += inicio[g]
+    baldes = np.empty(inicio[n_grupos], dtype=np.int64)
+    posicao = inicio[:-1].copy()
+    for d in destinos:
+        if grupo[d] >= 0 and capacidade_ociosa[d] >= limite:
+            baldes[posicao[grupo[d]]] = d
+            posicao[grupo[d]] += 1
+    
+    # Ponteiro por balde para o destino de maior capacidade ainda utilizável
+    cabeca = inicio[:-1].copy()
+    fim = inicio[1:]
+    
+    # Sentinela: quantidade de grupos que ainda têm algum destino utilizável
+    grupos_ativos = 0
+    for g in range(n_grupos):
+        if cabeca[g] < fim[g]:
+            grupos_ativos += 1
+    
+    origem_idx = np.empty(n, dtype=np.int64)
+    destino_idx = np.empty(n, dtype=np.int64)
+    quantidade = np.empty_like(demanda_na)
+    k = 0
+    
+    for o in origens:
+        # Origens estão em ordem decrescente: abaixo do mínimo, ou sem nenhum grupo
+        # com destino utilizável, as demais origens também não recebem alocação
+        if demanda_na[o] < limite or grupos_ativos == 0:
+            break
+        g = grupo[o]
+        if g < 0 or cabeca[g] == fim[g]:
+            continue
+        
+        # O destino na cabeça do balde é sempre o próximo utilizável: origens e
+        # destinos são disjuntos após o auto-atendimento, e o ponteiro avança
+        # assim que um destino fica abaixo do mínimo
+        restante = demanda_na[o]
+        while cabeca[g] < fim[g] and restante >= limite:
+            d = baldes[cabeca[g]]
+            ociosa = capacidade_ociosa[d]
+            
+            qtd_alocada = restante if restante < ociosa else ociosa
+            restante -= qtd_alocada
+            ociosa -= qtd_alocada
+            capacidade_ociosa[d] = ociosa
+            
+            origem_idx[k] = o
+            destino_idx[k] = d
+            quantidade[k] = qtd_alocada
+            k += 1
+            
+            if ociosa < limite:
+                cabeca[g] += 1
+                if cabeca[g] == fim[g]:
+                    grupos_ativos -= 1
+        demanda_na[o] = restante
+    
+    return origem_idx[:k], destino_idx[:k], quantidade[:k]
+
+# Sem restrição de grupo o guloso é uma varredura de dois ponteiros: origens e
+# destinos em ordem decrescente, avançando o destino quando fica abaixo do mínimo
+@njit(cache=True)
+def _varredura_sem_grupo(demanda_na, capacidade_ociosa, limite):
+    n = demanda_na.shape[0]
+    origens = np.argsort(-demanda_na, kind='mergesort')
+    destinos = np.argsort(-capacidade_ociosa, kind='mergesort')
+    
+    # Destinos utilizáveis formam um prefixo da ordem decrescente
+    n_destinos = 0
+    while n_destinos < n and capacidade_ociosa[destinos[n_destinos]] >= limite:
+        n_destinos += 1
+    
+    origem_idx = np.empty(n, dtype=np.int64)
+    destino_idx = np.empty(n, dtype=np.int64)
+    quantidade = np.empty_like(demanda_na)
+    k = 0
+    j = 0
+    
+    for o in origens:
+        if demanda_na[o] < limite or j == n_destinos:
+            break
+        restante = demanda_na[o]
+        while j < n_destinos and restante >= limite:
+            d = destinos[j]
+            ociosa = capacidade_ociosa[d]
+            
+            qtd_alocada = restante if restante < ociosa else ociosa
+            restante -= qtd_alocada
+            ociosa -= qtd_alocada
+            capacidade_ociosa[d] = ociosa
+            
+            origem_idx[k] = o
+            destino_idx[k] = d
+            quantidade[k] = qtd_alocada
+            k += 1
+            
+            if ociosa < limite:
+                j += 1
+        demanda_na[o] = restante
+    
+    return origem_idx[:k], destino_idx[:k], quantidade[:k]
+
 if __name__ == "__main__":
     st.set_page_config(page_title="Otimizador de Capacidade", page_icon="📊", layout="wide")
     main()
\ No newline at end of file